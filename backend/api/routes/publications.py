@@ -1,6 +1,8 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import FileResponse, StreamingResponse
 import os
+import json
+import asyncio
 import pandas as pd
 from typing import List, Dict
 import logging
@@ -11,6 +13,71 @@ router = APIRouter(prefix="/api")
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Change feed written by src/change_log.py
+CHANGES_LOG = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))), "data", "changes.jsonl")
+CHANGES_PAGE_LIMIT = 1000
+CHANGES_MAX_LIMIT = 10000
+SSE_POLL_INTERVAL = 2  # Seconds between checks for new changes when streaming
+
+def _line_at(f, pos):
+    """Return (start, version) of the first parseable log line starting at or after pos.
+
+    Malformed lines are stepped over, so version is None only at the end of the data.
+    """
+    if pos == 0:
+        f.seek(0)
+    else:
+        # Skip the remainder of the line containing pos - 1
+        f.seek(pos - 1)
+        f.readline()
+    while True:
+        start = f.tell()
+        line = f.readline()
+        # End of file, or a trailing line that is still being written
+        if not line.endswith(b'\n'):
+            return start, None
+        try:
+            return start, json.loads(line)['version']
+        except (ValueError, KeyError):
+            continue
+
+def _read_changes(since, limit):
+    """Read up to limit changes with a version greater than since.
+
+    Versions increase line by line, so the first matching line is found by
+    binary searching byte offsets; the cost depends on the number of changes
+    returned rather than the size of the log.
+    """
+    if not os.path.exists(CHANGES_LOG):
+        return [], False
+    with open(CHANGES_LOG, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        lo, hi = 0, f.tell()
+        while lo < hi:
+            mid = (lo + hi) // 2
+            _, version = _line_at(f, mid)
+            if version is None or version > since:
+                hi = mid
+            else:
+                lo = mid + 1
+        start, _ = _line_at(f, lo)
+        f.seek(start)
+        changes = []
+        for line in f:
+            # A line without a trailing newline is still being written
+            if not line.endswith(b'\n'):
+                break
+            try:
+                change = json.loads(line)
+                change['version']
+            except (ValueError, KeyError, TypeError):
+                logger.warning("Skipping malformed line in change log")
+                continue
+            if len(changes) == limit:
+                return changes, True
+            changes.append(change)
+        return changes, False
+
 @router.get("/publications", response_model=List[Dict])
 async def get_publications():
     """Get all publications from CSV files."""
@@ -78,6 +145,47 @@ async def get_publications():
         logger.error(f"Error in get_publications: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/publications/changes", response_model=Dict)
+async def get_publication_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(CHANGES_PAGE_LIMIT, ge=1, le=CHANGES_MAX_LIMIT)
+):
+    """Get publication changes (added, removed, citations_changed) after the since cursor."""
+    try:
+        changes, has_more = _read_changes(since, limit)
+        cursor = changes[-1]['version'] if changes else since
+        return {"changes": changes, "cursor": cursor, "has_more": has_more}
+
+    except Exception as e:
+        logger.error(f"Error in get_publication_changes: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/publications/changes/stream")
+async def stream_publication_changes(request: Request, since: int = Query(0, ge=0)):
+    """Stream publication changes after the since cursor as server-sent events."""
+    # Reconnecting EventSource clients resume from the last event they received
+    last_event_id = request.headers.get('last-event-id')
+    if last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+
+    async def event_stream():
+        cursor = since
+        while not await request.is_disconnected():
+            changes, has_more = _read_changes(cursor, CHANGES_PAGE_LIMIT)
+            for change in changes:
+                cursor = change['version']
+                yield f"id: {cursor}\nevent: change\ndata: {json.dumps(change)}\n\n"
+            if not has_more:
+                if not changes:
+                    yield ": keep-alive\n\n"
+                await asyncio.sleep(SSE_POLL_INTERVAL)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
 @router.get("/publications/{orcid}/download")
 async def download_publications(orcid: str):
     """Download publications CSV for a specific researcher."""
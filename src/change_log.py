@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+import os
+import json
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+import pandas as pd
+from datetime import datetime, timezone
+
+# Append-only log of publication changes, one JSON object per line.
+# Every entry carries a monotonically increasing version number that clients
+# use as a cursor for /api/publications/changes.
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHANGES_LOG = os.path.join(PROJECT_ROOT, "data", "changes.jsonl")
+
+CHANGE_ADDED = 'added'
+CHANGE_REMOVED = 'removed'
+CHANGE_CITATIONS = 'citations_changed'
+
+def _clean(value):
+    """Convert pandas/numpy values into plain JSON-serialisable values."""
+    if value is None:
+        return None
+    try:
+        if pd.isna(value):
+            return None
+    except (TypeError, ValueError):
+        pass
+    if isinstance(value, pd.Timestamp):
+        return value.strftime('%Y-%m-%d')
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+def _complete_end(f):
+    """Return the offset just past the last newline, ignoring a torn trailing line."""
+    f.seek(0, os.SEEK_END)
+    pos = f.tell()
+    block = 4096
+    while pos > 0:
+        step = min(block, pos)
+        pos -= step
+        f.seek(pos)
+        data = f.read(step)
+        newline = data.rfind(b'\n')
+        if newline != -1:
+            return pos + newline + 1
+    return 0
+
+def get_last_version(log_path=CHANGES_LOG):
+    """Return the version of the last complete entry in the log, or 0 if there is none."""
+    if not os.path.exists(log_path):
+        return 0
+    with open(log_path, 'rb') as f:
+        end = _complete_end(f)
+        if end == 0:
+            return 0
+        # Read backwards from the end until we have the whole last line
+        block = 4096
+        pos = end
+        data = b''
+        while pos > 0:
+            step = min(block, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+            lines = data.rstrip(b'\n').split(b'\n')
+            if len(lines) > 1 or pos == 0:
+                return json.loads(lines[-1])['version']
+    return 0
+
+def _truncate_torn_line(log_path):
+    """Drop a trailing line left without its newline by a crash mid-write."""
+    if not os.path.exists(log_path):
+        return
+    with open(log_path, 'r+b') as f:
+        end = _complete_end(f)
+        f.seek(0, os.SEEK_END)
+        if f.tell() != end:
+            f.truncate(end)
+            f.flush()
+            os.fsync(f.fileno())
+
+def _pmid_key(value):
+    """Normalise a PMID read from CSV (which may come back as int or float) to a string."""
+    value = _clean(value)
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+def make_change(change_type, orcid, row, previous_citations=None):
+    """Build a change entry for a publication row (dict or pandas Series)."""
+    change = {
+        'type': change_type,
+        'researcher_orcid': orcid,
+        'pmid': _pmid_key(row.get('pmid')),
+        'doi': _clean(row.get('doi')),
+        'title': _clean(row.get('title')),
+        'citations': _clean(row.get('citations')),
+    }
+    if previous_citations is not None:
+        change['previous_citations'] = _clean(previous_citations)
+    return change
+
+def append_changes(changes, log_path=CHANGES_LOG):
+    """Append changes to the log, assigning versions. Returns the last version written.
+
+    The tracker and citation scripts may run at the same time, so an exclusive
+    lock on a sidecar file is held while the next version is read and written.
+    """
+    if not changes:
+        return get_last_version(log_path)
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    with open(f"{log_path}.lock", 'w') as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        _truncate_torn_line(log_path)
+        version = get_last_version(log_path)
+        timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        lines = []
+        for change in changes:
+            version += 1
+            entry = {'version': version, 'timestamp': timestamp}
+            entry.update(change)
+            lines.append(json.dumps(entry, ensure_ascii=False))
+        with open(log_path, 'a', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        # The lock is released when the lock file is closed
+    return version
+
+def diff_publications(orcid, old_df, new_df):
+    """Compare two versions of a researcher's publications and return the changes.
+
+    Publications are matched on PMID, falling back to DOI when the PMID is missing.
+    """
+    def keyed(df):
+        # Keep only the columns a change entry needs, not a Series per row
+        rows = {}
+        if df is None or df.empty:
+            return rows
+        columns = [df[col] if col in df.columns else [None] * len(df) for col in ('pmid', 'doi', 'title', 'citations')]
+        for pmid, doi, title, citations in zip(*columns):
+            row = {'pmid': pmid, 'doi': doi, 'title': title, 'citations': citations}
+            key = _pmid_key(pmid) or _clean(doi)
+            if key:
+                rows[key] = row
+        return rows
+
+    old_rows = keyed(old_df)
+    new_rows = keyed(new_df)
+    changes = []
+    for key, row in new_rows.items():
+        if key not in old_rows:
+            changes.append(make_change(CHANGE_ADDED, orcid, row))
+            continue
+        old_citations = _clean(old_rows[key].get('citations'))
+        new_citations = _clean(row.get('citations'))
+        if old_citations != new_citations and new_citations is not None:
+            changes.append(make_change(CHANGE_CITATIONS, orcid, row, previous_citations=old_citations))
+    for key, row in old_rows.items():
+        if key not in new_rows:
+            changes.append(make_change(CHANGE_REMOVED, orcid, row))
+    return changes
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+import time
+import random
+import requests
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+
+CONNECT_TIMEOUT = 5  # Seconds to establish a connection
+READ_TIMEOUT = 30  # Seconds to wait for the server between bytes
+POOL_SIZE = 10  # Keep-alive connections kept per host
+MAX_RETRIES = 4  # Retries after the first attempt
+BACKOFF_BASE = 1  # Seconds; doubled on every retry
+MAX_BACKOFF = 60  # Longest single wait; a longer Retry-After opens the circuit instead
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+CIRCUIT_FAILURE_THRESHOLD = 5  # Consecutive failed attempts before the circuit opens
+CIRCUIT_RESET_TIMEOUT = 120  # Seconds the circuit stays open before a trial request
+
+class CircuitOpenError(requests.RequestException):
+    """Raised without contacting the server while the circuit breaker is open."""
+
+class CircuitBreaker:
+    """Stop calling an upstream that keeps failing, then let a single trial request through."""
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.open_until = None
+
+    def before_request(self):
+        if self.open_until is None:
+            return
+        remaining = self.open_until - time.monotonic()
+        if remaining > 0:
+            raise CircuitOpenError(f"Circuit open after repeated upstream failures; retry in {remaining:.0f}s")
+        # Half-open: allow this request through, one more failure reopens the circuit
+        self.open_until = None
+        self.failures = self.failure_threshold - 1
+
+    def record_success(self):
+        self.failures = 0
+        self.open_until = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self.trip(self.reset_timeout)
+
+    def trip(self, seconds):
+        """Open the circuit for the given number of seconds."""
+        self.open_until = time.monotonic() + seconds
+
+def _retry_after_seconds(response):
+    """Parse a Retry-After header given either in seconds or as an HTTP date."""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+class HttpClient:
+    """Shared HTTP client with pooled connections, timeouts, retries and a circuit breaker."""
+    def __init__(self, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), max_retries=MAX_RETRIES, breaker=None):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _backoff(self, attempt, response=None):
+        retry_after = _retry_after_seconds(response) if response is not None else None
+        if retry_after is None:
+            # Exponential backoff with jitter so retries don't arrive in lockstep
+            retry_after = min(BACKOFF_BASE * (2 ** attempt) * random.uniform(0.5, 1.5), MAX_BACKOFF)
+        elif retry_after > MAX_BACKOFF:
+            # Too long to wait inline; keep the circuit open until the server is ready again
+            self.breaker.trip(retry_after)
+            raise CircuitOpenError(f"Server asked to retry after {retry_after:.0f}s", response=response)
+        time.sleep(retry_after)
+
+    def get(self, url, **kwargs):
+        """GET url, retrying transient failures. Raises requests.RequestException on failure."""
+        kwargs.setdefault('timeout', self.timeout)
+        for attempt in range(self.max_retries + 1):
+            self.breaker.before_request()
+            try:
+                response = self.session.get(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self.breaker.record_failure()
+                if attempt == self.max_retries:
+                    raise
+                self._backoff(attempt)
+                continue
+
+            if response.status_code in RETRY_STATUSES:
+                self.breaker.record_failure()
+                if attempt == self.max_retries:
+                    response.raise_for_status()
+                self._backoff(attempt, response)
+                continue
+
+            # Other client errors mean the request itself is wrong, not that upstream is unhealthy
+            self.breaker.record_success()
+            response.raise_for_status()
+            return response
+
+    def close(self):
+        self.session.close()
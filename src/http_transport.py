@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import gzip
+import time
+import hashlib
+import requests
+from http_client import HttpClient
+
+# Transport used by the tracker for outbound HTTP, selected with PUBIT_HTTP_MODE:
+#   live   - talk to the network (default)
+#   record - talk to the network and save every response to the cassette store
+#   replay - serve responses from the cassette store without touching the network
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HTTP_MODE = os.environ.get('PUBIT_HTTP_MODE', 'live')
+CASSETTE_DIR = os.environ.get('PUBIT_CASSETTE_DIR', os.path.join(PROJECT_ROOT, 'data', 'cassettes'))
+# Seconds to wait before each replayed response, or "recorded" to reuse the recorded timings
+REPLAY_LATENCY = os.environ.get('PUBIT_REPLAY_LATENCY', '0')
+
+class CassetteMissError(LookupError):
+    """Raised in replay mode when no response was recorded for a URL."""
+
+class TransportResponse:
+    """Minimal stand-in for requests.Response built from a cassette entry."""
+    def __init__(self, url, status_code, text, headers=None):
+        self.url = url
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        """Raise requests.HTTPError for error statuses, as requests.Response does."""
+        if self.status_code >= 400:
+            kind = 'Client' if self.status_code < 500 else 'Server'
+            raise requests.HTTPError(f"{self.status_code} {kind} Error for url: {self.url}", response=self)
+
+class CassetteStore:
+    """On-disk store of recorded responses, one gzipped JSON file per URL."""
+    def __init__(self, directory=CASSETTE_DIR):
+        self.directory = directory
+
+    def _path(self, url):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        # Shard by the first two hex characters to keep directories small
+        return os.path.join(self.directory, key[:2], f"{key}.json.gz")
+
+    def load(self, url):
+        """Return the recorded entry for url, or None if it was never recorded."""
+        path = self._path(url)
+        if not os.path.exists(path):
+            return None
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save(self, url, response, elapsed):
+        """Record a response; the write is atomic so an interrupted run leaves no partial entries."""
+        path = self._path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {
+            'url': url,
+            'status_code': response.status_code,
+            'headers': {k: v for k, v in response.headers.items() if k.lower() in ('content-type', 'retry-after')},
+            'elapsed': round(elapsed, 3),
+            'text': response.text,
+        }
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+class LiveTransport:
+    """Send requests to the network through the shared pooled HTTP client."""
+    def __init__(self, client=None):
+        self.client = client or HttpClient()
+
+    def get(self, url):
+        return self.client.get(url)
+
+    def pause(self, seconds):
+        """Wait between requests to respect upstream rate limits."""
+        time.sleep(seconds)
+
+class RecordTransport(LiveTransport):
+    """Send requests to the network and record every response."""
+    def __init__(self, store, client=None):
+        super().__init__(client)
+        self.store = store
+
+    def get(self, url):
+        try:
+            response = super().get(url)
+        except requests.HTTPError as e:
+            # Record error responses too, so replay takes the same skip/abort path
+            if e.response is not None:
+                self.store.save(url, e.response, e.response.elapsed.total_seconds())
+            raise
+        # elapsed covers only the final attempt, not any retry backoff
+        self.store.save(url, response, response.elapsed.total_seconds())
+        return response
+
+class ReplayTransport:
+    """Serve recorded responses locally, optionally simulating network latency."""
+    def __init__(self, store, latency=0):
+        self.store = store
+        self.latency = latency
+
+    def get(self, url):
+        entry = self.store.load(url)
+        if entry is None:
+            raise CassetteMissError(f"No recorded response for {url} in {self.store.directory}")
+        delay = entry.get('elapsed', 0) if self.latency == 'recorded' else self.latency
+        if delay:
+            time.sleep(delay)
+        response = TransportResponse(entry['url'], entry['status_code'], entry['text'], entry.get('headers'))
+        response.raise_for_status()
+        return response
+
+    def pause(self, seconds):
+        """No upstream to rate limit when replaying, so don't wait."""
+
+def get_transport(mode=HTTP_MODE):
+    """Build the transport for the given mode (live, record or replay)."""
+    if mode == 'live':
+        return LiveTransport()
+    if mode == 'record':
+        return RecordTransport(CassetteStore())
+    if mode == 'replay':
+        latency = REPLAY_LATENCY
+        if latency != 'recorded':
+            try:
+                latency = float(latency)
+            except ValueError:
+                latency = -1
+            if latency < 0:
+                raise ValueError(f"Invalid PUBIT_REPLAY_LATENCY '{REPLAY_LATENCY}'. Use a number of seconds or 'recorded'")
+        return ReplayTransport(CassetteStore(), latency=latency)
+    raise ValueError(f"Invalid PUBIT_HTTP_MODE '{mode}'. Allowed modes: live, record, replay")
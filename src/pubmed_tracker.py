@@ -4,19 +4,37 @@ import pandas as pd
 import requests
 import os
 import re
-import time
 from bs4 import BeautifulSoup
 from urllib.parse import quote_plus
 import datetime
+import json
+import tempfile
+from change_log import append_changes, diff_publications, CHANGES_LOG
+from http_transport import get_transport, HTTP_MODE, CassetteMissError
+from http_client import CircuitOpenError, RETRY_STATUSES
 
 REQUEST_DELAY = 1  # Delay between requests in seconds
+CHUNK_SIZE = 50  # Publications held in memory before being appended to the partial file
+CHECKPOINT_MAX_AGE_DAYS = 30  # Older checkpoints are discarded and the researcher is searched again
 
 PUBMED_TXT_URL = "https://pubmed.ncbi.nlm.nih.gov/{}/?format=pubmed"
 
+# Live, record or replay transport, chosen with PUBIT_HTTP_MODE (see http_transport.py)
+transport = get_transport()
+
+# Replay runs write to a scratch directory so they are repeatable and leave data/ untouched
+if HTTP_MODE == 'replay':
+    OUTPUT_DIR = os.environ.get('PUBIT_REPLAY_OUTPUT_DIR') or tempfile.mkdtemp(prefix='pubit-replay-')
+    CHANGES_LOG_PATH = os.path.join(OUTPUT_DIR, 'changes.jsonl')
+else:
+    OUTPUT_DIR = 'data'
+    CHANGES_LOG_PATH = CHANGES_LOG
+PUBLICATIONS_DIR = os.path.join(OUTPUT_DIR, 'publications')
+
 # Helper to extract metadata from pubmed text format
 def fetch_pubmed_text_metadata(pmid, researcher_name, researcher_orcid):
     url = PUBMED_TXT_URL.format(pmid)
-    response = requests.get(url)
+    response = transport.get(url)
     text = response.text
 
     title = re.search(r'TI  - (.+)', text)
@@ -81,7 +99,7 @@ def get_pmids_by_orcid(orcid):
     page = 1
     while True:
         url = f"{base_url}&page={page}"
-        response = requests.get(url)
+        response = transport.get(url)
         soup = BeautifulSoup(response.text, 'html.parser')
         new_pmids = [span.text.strip() for span in soup.find_all('span', class_='docsum-pmid')]
         if not new_pmids:
@@ -91,7 +109,7 @@ def get_pmids_by_orcid(orcid):
         if not next_button:
             break
         page += 1
-        time.sleep(REQUEST_DELAY)
+        transport.pause(REQUEST_DELAY)
     return pmids
 
 def get_pmids_by_name_and_affiliation(name, university):
@@ -102,7 +120,7 @@ def get_pmids_by_name_and_affiliation(name, university):
     page = 1
     while True:
         url = f"{base_url}&page={page}"
-        response = requests.get(url)
+        response = transport.get(url)
         soup = BeautifulSoup(response.text, 'html.parser')
         new_pmids = [span.text.strip() for span in soup.find_all('span', class_='docsum-pmid')]
         if not new_pmids:
@@ -112,11 +130,11 @@ def get_pmids_by_name_and_affiliation(name, university):
         if not next_button:
             break
         page += 1
-        time.sleep(REQUEST_DELAY)
+        transport.pause(REQUEST_DELAY)
     return pmids
 
 def save_publications_to_csv(orcid, publications):
-    os.makedirs('data/publications', exist_ok=True)
+    os.makedirs(PUBLICATIONS_DIR, exist_ok=True)
     df = pd.DataFrame(publications)
     
     # Add citations column if it doesn't exist and initialize to 0
@@ -144,7 +162,8 @@ def save_publications_to_csv(orcid, publications):
     df = df[column_order]
     
     # If the file already exists, merge with existing data preserving citation counts
-    csv_path = f'data/publications/{orcid}.csv'
+    csv_path = os.path.join(PUBLICATIONS_DIR, f'{orcid}.csv')
+    existing_df = None
     if os.path.exists(csv_path):
         existing_df = pd.read_csv(csv_path)
         if 'citations' in existing_df.columns:
@@ -153,15 +172,197 @@ def save_publications_to_csv(orcid, publications):
             # Update citations in new data where DOI matches
             df['citations'] = df['doi'].map(citation_map).fillna(0).astype(int)
     
+    # Record added/removed publications before writing the CSV: if we crash in
+    # between, the next run repeats the events rather than losing them
+    append_changes(diff_publications(orcid, existing_df, df), CHANGES_LOG_PATH)
+
     df.to_csv(csv_path, index=False)
 
+def get_ingest_paths(orcid):
+    """Return the partial CSV and checkpoint paths used while a researcher is being ingested.
+
+    Both start with a dot so the API ignores them until the run is finalised.
+    """
+    return (
+        os.path.join(PUBLICATIONS_DIR, f'.{orcid}.partial.csv'),
+        os.path.join(PUBLICATIONS_DIR, f'.{orcid}.checkpoint.json')
+    )
+
+def load_checkpoint(orcid, today):
+    """Load the checkpoint of an interrupted run, or None if there is nothing to resume."""
+    partial_path, checkpoint_path = get_ingest_paths(orcid)
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path) as f:
+        checkpoint = json.load(f)
+    started = pd.to_datetime(checkpoint.get('started'), errors='coerce')
+    if pd.isna(started) or (today - started) > pd.Timedelta(days=CHECKPOINT_MAX_AGE_DAYS):
+        print(f"  Discarding stale checkpoint from {checkpoint.get('started')}")
+        clear_checkpoint(orcid)
+        return None
+    return checkpoint
+
+def save_checkpoint(orcid, checkpoint):
+    """Write the checkpoint atomically so a crash never leaves it half written."""
+    _, checkpoint_path = get_ingest_paths(orcid)
+    tmp_path = f"{checkpoint_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, checkpoint_path)
+
+def clear_checkpoint(orcid):
+    for path in get_ingest_paths(orcid):
+        if os.path.exists(path):
+            os.remove(path)
+
+def append_publications_chunk(orcid, publications):
+    """Append a chunk of fetched publications to the researcher's partial CSV."""
+    partial_path, _ = get_ingest_paths(orcid)
+    write_header = not os.path.exists(partial_path)
+    with open(partial_path, 'a', newline='') as f:
+        pd.DataFrame(publications).to_csv(f, header=write_header, index=False)
+        f.flush()
+        os.fsync(f.fileno())
+
+def truncate_partial(orcid, size):
+    """Cut the partial CSV back to the size recorded in the checkpoint.
+
+    This drops any rows (including a half-written one) appended after the last
+    checkpoint, so they are fetched again rather than misparsed.
+    """
+    partial_path, _ = get_ingest_paths(orcid)
+    if not os.path.exists(partial_path):
+        return
+    if size == 0:
+        os.remove(partial_path)
+        return
+    with open(partial_path, 'r+b') as f:
+        f.truncate(size)
+
+def load_seen_publications(orcid):
+    """Rebuild the PMIDs and titles already written by an interrupted run."""
+    partial_path, _ = get_ingest_paths(orcid)
+    seen_pmids = set()
+    seen_titles = set()
+    if not os.path.exists(partial_path):
+        return seen_pmids, seen_titles
+    # Only two columns are read, in chunks, so resuming doesn't load the whole file
+    for chunk in pd.read_csv(partial_path, usecols=['pmid', 'title'], dtype=str, keep_default_na=False, chunksize=1000):
+        for pmid, title in zip(chunk['pmid'], chunk['title']):
+            if pmid:
+                seen_pmids.add(pmid)
+            elif title:
+                seen_titles.add(title.strip().lower())
+    return seen_pmids, seen_titles
+
+def ingest_researcher(researcher_name, researcher_orcid, university, today):
+    """Fetch a researcher's publications, streaming them to disk in chunks.
+
+    Progress is checkpointed after every chunk, so an interrupted run resumes
+    at the first PMID whose publication was not yet written. While fetching,
+    at most CHUNK_SIZE publications are held in memory; the final merge into
+    the researcher's CSV still loads their finished table once.
+    """
+    os.makedirs(PUBLICATIONS_DIR, exist_ok=True)
+    partial_path, _ = get_ingest_paths(researcher_orcid)
+    checkpoint = load_checkpoint(researcher_orcid, today)
+    if checkpoint:
+        pmids = checkpoint['pmids']
+        print(f"  Resuming from checkpoint: {checkpoint['next_index']} of {len(pmids)} PMIDs processed")
+        truncate_partial(researcher_orcid, checkpoint.get('partial_size', 0))
+    else:
+        clear_checkpoint(researcher_orcid)
+        pmids_orcid = get_pmids_by_orcid(researcher_orcid)
+        print(f"  ORCID search found {len(pmids_orcid)} PMIDs")
+        pmids_name_affil = get_pmids_by_name_and_affiliation(researcher_name, university)
+        print(f"  Name+Affiliation search found {len(pmids_name_affil)} PMIDs")
+        # Sorted so the processing order is the same when resuming
+        pmids = sorted(set(pmids_orcid) | set(pmids_name_affil))
+        print(f"  Combined unique PMIDs: {len(pmids)}")
+        checkpoint = {'started': today.strftime('%Y-%m-%d'), 'pmids': pmids, 'next_index': 0, 'partial_size': 0}
+        save_checkpoint(researcher_orcid, checkpoint)
+
+    seen_pmids, seen_titles = load_seen_publications(researcher_orcid)
+    publications = []
+
+    def flush(next_index):
+        if publications:
+            append_publications_chunk(researcher_orcid, publications)
+            publications.clear()
+        checkpoint['next_index'] = next_index
+        checkpoint['partial_size'] = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+        save_checkpoint(researcher_orcid, checkpoint)
+
+    for index in range(checkpoint['next_index'], len(pmids)):
+        pmid = pmids[index]
+        if pmid in seen_pmids:
+            continue
+        try:
+            pub = fetch_pubmed_text_metadata(pmid, researcher_name, researcher_orcid)
+        except requests.HTTPError as e:
+            # A bad PMID (e.g. 404) is skipped; upstream failures still abort the researcher
+            if e.response is None or e.response.status_code in RETRY_STATUSES:
+                raise
+            print(f"  Skipping PMID {pmid}: {e}")
+            continue
+        if pub['pmid']:
+            if pub['pmid'] in seen_pmids:
+                continue
+            seen_pmids.add(pub['pmid'])
+        else:
+            title_key = pub['title'].strip().lower() if pub['title'] else pmid
+            if title_key in seen_titles:
+                continue
+            seen_titles.add(title_key)
+        publications.append(pub)
+        if len(publications) >= CHUNK_SIZE:
+            flush(index + 1)
+        transport.pause(REQUEST_DELAY)
+    flush(len(pmids))
+
+    # Merge the streamed publications into the researcher's CSV and drop the checkpoint
+    if os.path.exists(partial_path):
+        publications = pd.read_csv(partial_path, dtype={'pmid': str})
+    print(f"  Publications to save: {len(publications)}")
+    save_publications_to_csv(researcher_orcid, publications)
+    clear_checkpoint(researcher_orcid)
+    return len(publications)
+
+def save_last_pubmed_search(orcid, date):
+    """Set one researcher's last_pubmed_search in researchers.csv.
+
+    The file is re-read rather than rewritten from the copy loaded at startup, so
+    researchers added or edited through the API during a long run are kept. It is
+    written to a temporary file and swapped in, so a crash can't corrupt it.
+    """
+    output_path = os.path.join(OUTPUT_DIR, 'researchers.csv')
+    source_path = output_path if os.path.exists(output_path) else 'data/researchers.csv'
+    df = pd.read_csv(source_path)
+    if 'last_pubmed_search' not in df.columns:
+        df['last_pubmed_search'] = None
+    # An all-empty column is read as float; store dates as strings
+    df['last_pubmed_search'] = df['last_pubmed_search'].astype(object)
+    df.loc[df['orcid'] == orcid, 'last_pubmed_search'] = date
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, 'w', newline='') as f:
+        df.to_csv(f, index=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, output_path)
+
 def main():
+    if HTTP_MODE == 'replay':
+        print(f"Replaying recorded responses, writing output to {OUTPUT_DIR}")
     researchers_df = pd.read_csv('data/researchers.csv')
     today = pd.Timestamp.today().normalize()
-    updated = False
-    for idx, row in researchers_df.iterrows():
+    for _, row in researchers_df.iterrows():
         last_search = row.get('last_pubmed_search', None)
-        if pd.isna(last_search) or not last_search:
+        if HTTP_MODE in ('record', 'replay'):
+            # Cassette runs always cover every researcher, so replay finds what record saved
+            needs_search = True
+        elif pd.isna(last_search) or not last_search:
             needs_search = True
         else:
             try:
@@ -175,39 +376,22 @@ def main():
         researcher_name = row['name']
         researcher_orcid = row['orcid']
         print(f"Processing: {researcher_name} ({researcher_orcid})")
-        pmids_orcid = get_pmids_by_orcid(researcher_orcid)
-        print(f"  ORCID search found {len(pmids_orcid)} PMIDs")
-        pmids_name_affil = get_pmids_by_name_and_affiliation(researcher_name, row['university'])
-        print(f"  Name+Affiliation search found {len(pmids_name_affil)} PMIDs")
-        all_pmids = set(pmids_orcid) | set(pmids_name_affil)
-        print(f"  Combined unique PMIDs: {len(all_pmids)}")
-        publications = []
-        seen_pmids = set()
-        seen_titles = set()
-        for pmid in all_pmids:
-            if pmid in seen_pmids:
-                continue
-            pub = fetch_pubmed_text_metadata(pmid, researcher_name, researcher_orcid)
-            if pub['pmid']:
-                if pub['pmid'] in seen_pmids:
-                    continue
-                seen_pmids.add(pub['pmid'])
-            else:
-                title_key = pub['title'].strip().lower() if pub['title'] else pmid
-                if title_key in seen_titles:
-                    continue
-                seen_titles.add(title_key)
-            publications.append(pub)
-            time.sleep(REQUEST_DELAY)
-        print(f"  Publications to save: {len(publications)}")
-        save_publications_to_csv(researcher_orcid, publications)
-        print(f"Saved {len(publications)} publications for {researcher_orcid}")
-        # Update last_pubmed_search to today
-        researchers_df.at[idx, 'last_pubmed_search'] = today.strftime('%Y-%m-%d')
-        updated = True
-    if updated:
-        researchers_df.to_csv('data/researchers.csv', index=False)
-        print("Updated last_pubmed_search for processed researchers.")
+        try:
+            saved = ingest_researcher(researcher_name, researcher_orcid, row['university'], today)
+            print(f"Saved {saved} publications for {researcher_orcid}")
+        except CassetteMissError as e:
+            print(f"Cannot replay {researcher_orcid}, the cassettes are incomplete: {e}")
+            continue
+        except CircuitOpenError as e:
+            print(f"Stopping run, PubMed keeps failing: {e}")
+            break
+        except requests.RequestException as e:
+            # Leave last_pubmed_search unchanged so the next run resumes from the checkpoint
+            print(f"Failed to fetch publications for {researcher_orcid}: {e}")
+            continue
+        # Save last_pubmed_search right away so a later crash doesn't repeat this researcher
+        save_last_pubmed_search(researcher_orcid, today.strftime('%Y-%m-%d'))
+        print(f"Updated last_pubmed_search for {researcher_orcid}")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
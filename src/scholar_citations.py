@@ -15,6 +15,7 @@ import logging
 import random
 import undetected_chromedriver as uc
 import glob
+from change_log import append_changes, make_change, CHANGE_CITATIONS
 
 # Configure logging
 logging.basicConfig(
@@ -166,6 +167,8 @@ def update_citations():
                                     df.at[idx, 'citations'] = citations
                                     citations_updated = True
                                     logging.info(f"Updated citations from {current_citations} to {citations} for DOI: {row['doi']} in {file}")
+                                    # Log the change first so a crash before the CSV write can't lose it
+                                    append_changes([make_change(CHANGE_CITATIONS, orcid, df.loc[idx], previous_citations=current_citations)])
                                     df.to_csv(file, index=False)
                                 else:
                                     logging.info(f"Keeping existing citation count of {current_citations} for DOI: {row['doi']} in {file}")